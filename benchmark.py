@@ -0,0 +1,145 @@
+"""Usage:
+  benchmark.py [<file>] [--size=<MB>] [--repeat=<N>]
+  benchmark.py (-h | --help)
+
+Options:
+  <file>                SGM file to benchmark with, otherwise one is generated
+  --size=<MB>           Size of the generated file in megabytes [default: 20]
+  --repeat=<N>          Number of timed runs, best one is reported [default: 3]
+  -h --help             Show this screen.
+
+Compares the former text I/O path of replace() (decode, run str patterns, encode with newline translation)
+with the bytes path (run byte patterns directly on file contents) over the alpha rules. Both paths write
+NEWLINE line endings and must produce the same output.
+"""
+
+import io
+import os
+import re
+import tempfile
+import timeit
+from docopt import docopt
+
+import pull
+
+SAMPLE = (b'<REGTEXT TITLE="7" PART="319">\r\n'
+          b'<AMDPAR>2. Section 319.56-3 is amended by revising paragraph (b) to read as follows:</AMDPAR>\r\n'
+          b'<SECTION>\r\n'
+          b'<SECTNO>&sect;&thnsp;319.56-3</SECTNO>\r\n'
+          b'<SUBJECT>General requirements for all imported fruits and vegetables.</SUBJECT>\r\n'
+          b'<STARS/>\r\n'
+          b'<P>(b) Some ``quoted\'\' text &mdash; with  double  spaces &prime; and &hyphen;.</P>\r\n'
+          b'<PRTPAGE P="65433">\r\n'
+          b'</SECTION>\r\n'
+          b'</REGTEXT>\r\n')
+
+
+def text_rules():
+    """
+    Former alpha rules: the "\r" rule back at its place in the chain, just before the "'PART '" rule
+
+    @rtype : list
+    @return: list of compiled replacement patterns [search pattern, replacement string]
+    """
+    regexes = pull.alpha_array()
+    index = [pattern[0].pattern for pattern in regexes].index(re.escape("'PART '"))
+    return regexes[:index] + [[re.compile("\r", re.MULTILINE), "\n"]] + regexes[index:]
+
+
+def text_path(filename, regexes):
+    """
+    Former replace(): decode, str patterns, text mode write with newline translation
+
+    @param filename: file to process in place
+    @param regexes: list of compiled replacement patterns [search pattern, replacement string]
+    """
+    with open(filename, 'rb') as content_file:
+        file_string = content_file.read().decode(pull.ENCODING)
+    file_string = pull.apply_rules(file_string, regexes)
+    with io.open(filename, 'w', encoding=pull.ENCODING, newline=pull.NEWLINE.decode(pull.ENCODING)) as file_handle:
+        file_handle.write(file_string)
+
+
+def bytes_path(filename, regexes):
+    """
+    replace(): byte patterns run directly on file contents
+
+    @param filename: file to process in place
+    @param regexes: list of compiled byte replacement patterns [search pattern, replacement bytes]
+    """
+    pull.write_text(filename, pull.apply_rules(pull.read_text(filename), regexes))
+
+
+def run_once(path, filename, regexes, data):
+    """
+    Output of one run of a path, to check both paths agree
+
+    @rtype : bytes
+    @param path: text_path or bytes_path
+    @param filename: scratch file
+    @param regexes: rules for that path
+    @param data: input contents
+    @return: output contents
+    """
+    with open(filename, 'wb') as handle:
+        handle.write(data)
+    path(filename, regexes)
+    with open(filename, 'rb') as handle:
+        return handle.read()
+
+
+def transcode_only(data):
+    """
+    Just the decode/encode and newline translation the text path does around the rules
+
+    @type data: bytes
+    @param data: file contents
+    """
+    data.decode(pull.ENCODING).replace('\r', '\n').replace('\n', pull.NEWLINE.decode(pull.ENCODING)).encode(
+        pull.ENCODING)
+
+
+def best(stmt, setup, repeat):
+    """
+    Best wall time of a statement over several runs
+
+    @rtype : float
+    @param stmt: callable to time
+    @param setup: callable or statement run before each timing
+    @param repeat: number of runs
+    @return: seconds
+    """
+    return min(timeit.repeat(stmt, setup=setup, repeat=repeat, number=1))
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    repeat = int(args['--repeat'])
+    if args['<file>']:
+        with open(args['<file>'], 'rb') as content_file:
+            data = content_file.read()
+    else:
+        data = SAMPLE * (int(args['--size']) * 1024 * 1024 // len(SAMPLE))
+
+    fd, work_file = tempfile.mkstemp(suffix='.SGM')
+    os.close(fd)
+
+    def reset():
+        with open(work_file, 'wb') as handle:
+            handle.write(data)
+
+    str_rules = text_rules()
+    byte_rules = pull.byte_rules(pull.alpha_array())
+    try:
+        print("Input: {0:.1f} MB, {1} rules".format(len(data) / 1048576.0, len(byte_rules)))
+        print("Outputs identical: {0}".format(
+            run_once(text_path, work_file, str_rules, data) == run_once(bytes_path, work_file, byte_rules, data)))
+        transcode = best(lambda: transcode_only(data), "pass", repeat)
+        print("Decode/encode + newline translation alone: {0:.3f}s".format(transcode))
+        text = best(lambda: text_path(work_file, str_rules), reset, repeat)
+        print("Text path (former replace):               {0:.3f}s".format(text))
+        raw = best(lambda: bytes_path(work_file, byte_rules), reset, repeat)
+        print("Bytes path (replace):                     {0:.3f}s".format(raw))
+        print("Saved:                                    {0:.3f}s ({1:.1%})".format(text - raw, (text - raw) / text))
+    finally:
+        os.remove(work_file)
@@ -2,6 +2,7 @@
   pull.py set
   pull.py auto <to> [--date=<MMDDYY>]
   pull.py move <from> <to> [--date=<MMDDYY>]
+  pull.py dev <file> [--omega]
   pull.py (-h | --help)
   pull.py (-v | --version)
 
@@ -9,6 +10,8 @@ Options:
   set                   Executes routine with set directories and today's date
   auto                  Executes routine with specified directory and date
   move                  Copies and combines SGM files from source to dest.
+  dev                   Runs alpha rules on a file from checkpoints, shows diff
+  --omega               Run alpha and omega rules in dev mode
   --date=<MMDDYY>       Optional date of the files to pull
   -h --help             Show this screen.
   -v --version          Show version.
@@ -20,7 +23,11 @@ __author__ = 'sjohnson'
 import sys
 import os
 import shutil
-import glob
+import json
+import zlib
+import hashlib
+import difflib
+import time
 import re
 import collections
 from docopt import docopt
@@ -35,6 +42,41 @@ except ImportError:
          'https://github.com/halst/schema')
 
 
+# TOOFR file names carry a two-letter month code (DDMMR*.SGM); output files use the three-letter one
+MONTH_CODES = {
+    '01': ("JA", "JAN"),
+    '02': ("FE", "FEB"),
+    '03': ("MR", "MAR"),
+    '04': ("AP", "APR"),
+    '05': ("MY", "MAY"),
+    '06': ("JN", "JUN"),
+    '07': ("JY", "JUL"),
+    '08': ("AU", "AUG"),
+    '09': ("SE", "SEP"),
+    '10': ("OC", "OCT"),
+    '11': ("NO", "NOV"),
+    '12': ("DE", "DEC"),
+}
+
+# All files are read and written as bytes in this encoding; line endings become "\n" on read and NEWLINE on write
+ENCODING = 'utf-8'
+NEWLINE = os.linesep.encode(ENCODING)
+
+# Directory listings of source shares persist here between runs
+INVENTORY_CACHE = os.path.join(os.path.expanduser('~'), '.pull_inventory.json')
+
+# Directory mtimes on the share are coarse: a listing taken this close after the last change may miss files
+MTIME_GRANULARITY = 2
+
+# Matches the DDMMR*.SGM naming; names are upper-cased first since the share is case-insensitive
+SGM_NAME = re.compile("^(\\d{2})(" + "|".join(code for code, _ in MONTH_CODES.values()) + ")R.*\\.SGM$")
+
+# Developer mode snapshots of the rule chain: one every CHECKPOINT_INTERVAL rules, at most CHECKPOINT_LIMIT kept
+CHECKPOINT_DIR = os.path.join(os.path.expanduser('~'), '.pull_checkpoints')
+CHECKPOINT_INTERVAL = 25
+CHECKPOINT_LIMIT = 200
+
+
 # This class provides the switch functionality we want. You only need to look at
 # this if you want to know how this works. It only needs to be defined
 # once, no need to muck around with its internals.
@@ -326,7 +368,6 @@ def alpha_array():
         [re.compile(re.escape(" HTYPE='CENTER'"), re.MULTILINE), ""],
         [re.compile(re.escape(" ROTATION='P'"), re.MULTILINE), ""],
         [re.compile("<\?USGPO Galley Info Start\:.*?Galley Info End\?>", re.DOTALL), ""],
-        [re.compile("\r", re.MULTILINE), "\n"],
         [re.compile(re.escape("'PART '"), re.DOTALL), "' PART='"],
         [re.compile(re.escape("TITLE=' "), re.DOTALL), "TITLE='"],
         [re.compile(re.escape(" ' PART="), re.DOTALL), "' PART="],
@@ -425,23 +466,246 @@ def replace(filename, regexes):
     @param filename: filename where replacements should take place
     @param regexes: list of compiled replacement patterns [search pattern, replacement string]
     """
+    write_text(filename, apply_rules(read_text(filename), byte_rules(regexes)))
+    return
+
+
+def read_text(filename):
+    """
+    Reads a file as bytes with line endings normalized to "\n"
+
+    @rtype : bytes
+    @param filename: file to read
+    @return: file contents
+    """
     with open(filename, 'rb') as content_file:
-        file_string = content_file.read().decode()
+        file_string = content_file.read()
+    if b'\r' in file_string:
+        file_string = file_string.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    return file_string
 
+
+def write_text(filename, file_string):
+    """
+    Writes bytes to a file with "\n" line endings translated to NEWLINE
+
+    @param filename: file to write, truncated if it exists
+    @param file_string: contents with "\n" line endings
+    """
+    if NEWLINE != b'\n':
+        file_string = file_string.replace(b'\n', NEWLINE)
+    with open(filename, 'wb') as file_handle:
+        file_handle.write(file_string)
+
+
+def byte_rules(regexes):
+    """
+    Recompiles replacement patterns as byte patterns in ENCODING so they run on file contents without decoding
+
+    @rtype : list
+    @param regexes: list of compiled replacement patterns [search pattern, replacement string]
+    @return: list of compiled byte replacement patterns [search pattern, replacement bytes]
+    """
+    return [[re.compile(pattern[0].pattern.encode(ENCODING), pattern[0].flags & ~re.UNICODE),
+             pattern[1].encode(ENCODING)] for pattern in regexes]
+
+
+def apply_rules(file_string, regexes):
+    """
+    Applies a list of replacement patterns to file contents in order
+
+    @rtype : bytes
+    @param file_string: contents to process, bytes for byte patterns (str patterns need str contents)
+    @param regexes: list of compiled byte replacement patterns [search pattern, replacement bytes]
+    @return: processed contents
+    """
     # Use RE package to allow for replacement (also allowing for (multiline) REGEX)
     for pattern in regexes:
         try:
             file_string = pattern[0].sub(pattern[1], file_string)
         except Exception as e:
-            exit("Bad regular expression: " + pattern)
+            exit("Bad regular expression: " + repr(pattern[0].pattern))
+    return file_string
 
-    # Write contents to file.
-    # Using mode 'w' truncates the file.
-    with open(filename, 'w') as file_handle:
-        file_handle.write(file_string)
+
+def chain_keys(file_string, regexes):
+    """
+    Hashes every prefix of a rule chain together with its input, so an edited rule changes only later keys
+
+    @rtype : list
+    @param file_string: input contents of the chain
+    @param regexes: list of compiled byte replacement patterns [search pattern, replacement bytes]
+    @return: list of hex digests, item N identifying the contents after the first N rules
+    """
+    digest = hashlib.sha1(file_string)
+    keys = [digest.hexdigest()]
+    for pattern in regexes:
+        digest.update(repr((pattern[0].pattern, pattern[0].flags, pattern[1])).encode(ENCODING))
+        keys.append(digest.hexdigest())
+    return keys
+
+
+def load_snapshot(path):
+    """
+    Reads a compressed snapshot and marks it as recently used
+
+    @rtype : bytes
+    @param path: snapshot file
+    @return: snapshot contents
+    """
+    with open(path, 'rb') as snapshot_file:
+        file_string = zlib.decompress(snapshot_file.read())
+    os.utime(path, None)
+    return file_string
+
+
+def save_snapshot(path, file_string):
+    """
+    Writes a compressed snapshot
+
+    @param path: snapshot file
+    @param file_string: snapshot contents
+    """
+    with open(path, 'wb') as snapshot_file:
+        snapshot_file.write(zlib.compress(file_string))
+
+
+def evict_checkpoints(checkpoint_dir, limit=CHECKPOINT_LIMIT):
+    """
+    Deletes least recently used checkpoints and previous outputs beyond the limit
+
+    @param checkpoint_dir: directory holding the checkpoints
+    @param limit: number of snapshots to keep
+    """
+    paths = [os.path.join(checkpoint_dir, name) for name in os.listdir(checkpoint_dir)
+             if name.endswith('.ckpt') or name.endswith('.last')]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[limit:]:
+        os.remove(path)
+
+
+def checkpoint_rules(file_string, regexes, checkpoint_dir=CHECKPOINT_DIR, interval=CHECKPOINT_INTERVAL):
+    """
+    Applies a rule chain resuming from the last checkpoint whose rule prefix and input are unchanged,
+    and snapshots the contents every "interval" rules along the way
+
+    @rtype : tuple
+    @param file_string: contents to process
+    @param regexes: list of compiled byte replacement patterns [search pattern, replacement bytes]
+    @param checkpoint_dir: directory holding the checkpoints
+    @param interval: number of rules between checkpoints
+    @return: processed contents and the number of rules skipped thanks to a checkpoint
+    """
+    if not os.path.exists(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+    keys = chain_keys(file_string, regexes)
+    stops = sorted(set(list(range(interval, len(regexes), interval)) + [len(regexes)]))
+
+    resume = 0
+    for stop in reversed(stops):
+        path = os.path.join(checkpoint_dir, keys[stop] + '.ckpt')
+        if os.path.isfile(path):
+            file_string = load_snapshot(path)
+            resume = stop
+            break
+
+    start = resume
+    for stop in stops:
+        if stop <= resume:
+            continue
+        file_string = apply_rules(file_string, regexes[start:stop])
+        save_snapshot(os.path.join(checkpoint_dir, keys[stop] + '.ckpt'), file_string)
+        start = stop
+    return file_string, resume
+
+
+def dev_rules(filename, regexes, chain, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    Developer mode: runs a rule chain on a file from checkpoints without modifying the file, and prints the diff
+    against the output of the previous run of the same chain on the same file
+
+    @type filename: str
+    @type regexes: list
+    @type chain: str
+    @param filename: file to run the rules on
+    @param regexes: list of compiled replacement patterns [search pattern, replacement string]
+    @param chain: name of the rule chain ("alpha" or "omega"), so edits to its rules still diff against the last run
+    @param checkpoint_dir: directory holding the checkpoints
+    """
+    file_string, resume = checkpoint_rules(read_text(filename), byte_rules(regexes), checkpoint_dir)
+    print("Resumed at rule " + str(resume) + " of " + str(len(regexes)))
+
+    # Previous output is kept per file and chain
+    last_path = os.path.join(checkpoint_dir, hashlib.sha1(
+        (os.path.abspath(filename) + '\n' + chain).encode(ENCODING)).hexdigest() + '.last')
+    if os.path.isfile(last_path):
+        # Only the diff is decoded, for display
+        previous = load_snapshot(last_path).decode(ENCODING, 'replace')
+        sys.stdout.writelines(difflib.unified_diff(previous.splitlines(True),
+                                                   file_string.decode(ENCODING, 'replace').splitlines(True),
+                                                   'previous', 'current'))
+    save_snapshot(last_path, file_string)
+    evict_checkpoints(checkpoint_dir)
     return
 
 
+def scan_inventory(from_dir):
+    """
+    Lists a source directory once and groups its SGM files by the DDMM day code in their names
+
+    @rtype : dict
+    @param from_dir: directory holding DDMMR*.SGM files
+    @return: dictionary of day code (e.g. "01NO") to sorted list of file names
+    """
+    try:
+        entries = [entry.name for entry in os.scandir(from_dir) if entry.is_file()]
+    except AttributeError:
+        # os.scandir is not available before Python 3.5
+        entries = [name for name in os.listdir(from_dir) if os.path.isfile(os.path.join(from_dir, name))]
+    inventory = defaultdict(list)
+    for name in entries:
+        match = SGM_NAME.match(name.upper())
+        if match:
+            inventory[match.group(1) + match.group(2)].append(name)
+    for names in inventory.values():
+        names.sort()
+    return dict(inventory)
+
+
+def date_inventory(from_dir, cache_file=INVENTORY_CACHE):
+    """
+    Returns the day code to file names map of a source directory, rescanning it when its mtime has changed
+    or the cached listing was taken within MTIME_GRANULARITY of that mtime
+
+    @rtype : dict
+    @param from_dir: directory holding DDMMR*.SGM files
+    @param cache_file: JSON file where inventories of previously scanned directories are kept
+    @return: dictionary of day code (e.g. "01NO") to sorted list of file names
+    """
+    key = os.path.abspath(from_dir)
+    mtime = os.stat(from_dir).st_mtime
+    cache = dict()
+    if os.path.isfile(cache_file):
+        try:
+            with open(cache_file, 'r') as cache_handle:
+                cache = json.load(cache_handle)
+        except ValueError:
+            cache = dict()
+    if key in cache and cache[key]['mtime'] == mtime and \
+            cache[key].get('scan_time', mtime) - mtime > MTIME_GRANULARITY:
+        return cache[key]['files']
+
+    scan_time = time.time()
+    inventory = scan_inventory(from_dir)
+    cache[key] = {'mtime': mtime, 'scan_time': scan_time, 'files': inventory}
+    try:
+        with open(cache_file, 'w') as cache_handle:
+            json.dump(cache, cache_handle)
+    except (IOError, OSError) as err:
+        print("Warning: could not save directory inventory: " + str(err))
+    return inventory
+
+
 def move_files(from_dir, to_dir, file_date):
     """Moves the files from one dir to another. Optional date specifies particular date, otherwise today's used
     @type from_dir: str
@@ -454,64 +718,14 @@ def move_files(from_dir, to_dir, file_date):
     """
     if file_date is None:
         file_date = date.today().strftime("%m%d%y")
-    sMM = file_date[0:2]
+    try:
+        sMM, sMMM = MONTH_CODES[file_date[0:2]]
+    except KeyError:
+        sys.exit("Missing month!!!")
     sDD = file_date[2:4]
     sYY = file_date[4:6]
-    sMMM = ''
-
-    for case in switch(sMM):
-        if case('01'):
-            sMM = "JA"
-            sMMM = "JAN"
-            break
-        if case('02'):
-            sMM = "FE"
-            sMMM = "FEB"
-            break
-        if case('03'):
-            sMM = "MR"
-            sMMM = "MAR"
-            break
-        if case('04'):
-            sMM = "AP"
-            sMMM = "APR"
-            break
-        if case('05'):
-            sMM = "MY"
-            sMMM = "MAY"
-            break
-        if case('06'):
-            sMM = "JN"
-            sMMM = "JUN"
-            break
-        if case('07'):
-            sMM = "JY"
-            sMMM = "JUL"
-            break
-        if case('08'):
-            sMM = "AU"
-            sMMM = "AUG"
-            break
-        if case('09'):
-            sMM = "SE"
-            sMMM = "SEP"
-            break
-        if case('10'):
-            sMM = "OC"
-            sMMM = "OCT"
-            break
-        if case('11'):
-            sMM = "NO"
-            sMMM = "NOV"
-            break
-        if case('12'):
-            sMM = "DE"
-            sMMM = "DEC"
-            break
-        if case():
-            sys.exit("Missing month!!!")
 
-    file_set = glob.glob(os.path.join(from_dir, sDD + sMM + 'R*.SGM'))
+    file_set = [os.path.join(from_dir, f) for f in date_inventory(from_dir).get(sDD + sMM, [])]
     if file_set:
         dest_file = open(os.path.join(to_dir, sYY + sMMM + sDD), 'wb')
         for filename in file_set:
@@ -559,43 +773,43 @@ def partext(temp_file, file_date):
     @param file_date: Date of the file
     @return: Processed file
     """
-    file_string = ''
+    file_string = b''
     if file_date is None:
         eff_date = date.today().strftime("%Y%m%d")
     else:
         eff_date = datetime.strptime(file_date, "%m%d%y").strftime("%Y%m%d")
     if os.path.isfile(temp_file):
         # Read contents from file as a single string
-        with open(temp_file, 'rb') as content_file:
-            file_string = content_file.read().decode()
+        file_string = read_text(temp_file)
 
-    new_file_string = ''
-    vol_num = re.findall('<VOL>(\d*)', file_string)[0]
+    new_file_string = []
+    vol_num = re.findall(b'<VOL>(\d*)', file_string)[0]
 
     # Get a dictionary of Effective dates and their location for attaching to REGTEXT
     effdates_info = defaultdict(list)
     effdates_info[0].append(datetime.strptime(eff_date, "%Y%m%d"))
-    effdates_info[0].append("Pull date: {0:%B} {0.day}, {0:%Y}".format(datetime.strptime(eff_date, "%Y%m%d")))
-    for eff_date_itr in re.finditer(re.compile("DATE.?><HED>DATES.*\n?<P>(.*)", re.MULTILINE), file_string):
+    effdates_info[0].append("Pull date: {0:%B} {0.day}, {0:%Y}".format(
+        datetime.strptime(eff_date, "%Y%m%d")).encode(ENCODING))
+    for eff_date_itr in re.finditer(re.compile(b"DATE.?><HED>DATES.*\n?<P>(.*)", re.MULTILINE), file_string):
         if eff_date_itr.group():
-            eff_date_str = re.findall("(\w*) (\d{1,2}), (\d{4})", eff_date_itr.group())
+            eff_date_str = re.findall(b"(\w*) (\d{1,2}), (\d{4})", eff_date_itr.group())
 
             if len(eff_date_str) == 1:
                 try:
                     effdates_info[eff_date_itr.start()].append(
-                        datetime.strptime(" ".join(str(i) for i in eff_date_str[0]), "%B %d %Y"))
+                        datetime.strptime(b" ".join(eff_date_str[0]).decode(ENCODING), "%B %d %Y"))
                     effdates_info[eff_date_itr.start()].append("{0:%B} {0.day}, {0:%Y}".format(
-                        datetime.strptime(" ".join(str(i) for i in eff_date_str[0]), "%B %d %Y")))
+                        datetime.strptime(b" ".join(eff_date_str[0]).decode(ENCODING), "%B %d %Y")).encode(ENCODING))
                 except ValueError as err:
                     print(err)
                     print("Please correct Effective Dates in a final file if/where December 31, 1969 appears!!!")
                     effdates_info[eff_date_itr.start()].append(datetime.fromtimestamp(0))
                     effdates_info[eff_date_itr.start()].append(
-                        "{0:%B} {0.day}, {0:%Y}".format(datetime.fromtimestamp(0)))
+                        "{0:%B} {0.day}, {0:%Y}".format(datetime.fromtimestamp(0)).encode(ENCODING))
             elif len(eff_date_str) > 1:
                 try:
                     effdates_info[eff_date_itr.start()].append(
-                        datetime.strptime(" ".join(str(i) for i in eff_date_str[0]), "%B %d %Y"))
+                        datetime.strptime(b" ".join(eff_date_str[0]).decode(ENCODING), "%B %d %Y"))
                 except ValueError as err:
                     print(err)
                     print("Please correct Effective Dates in a final file where December 31, 1969 appears!!!")
@@ -610,26 +824,26 @@ def partext(temp_file, file_date):
 
     # Get a dictionary of PRTPAGE tag numbers and their location for attaching to REGTEXT
     prtpage_info = dict()
-    prtpage_info[0] = ['00000']
-    for prt_page_itr in re.finditer(re.compile("\s*<PRTPAGE P=\'(\d+)\'>\s*"), file_string):
+    prtpage_info[0] = [b'00000']
+    for prt_page_itr in re.finditer(re.compile(b"\s*<PRTPAGE P=\'(\d+)\'>\s*"), file_string):
         if prt_page_itr.group():
-            pg_num = re.findall("\d+", prt_page_itr.group())
+            pg_num = re.findall(b"\d+", prt_page_itr.group())
             prtpage_info[prt_page_itr.start()] = pg_num
         else:
-            prtpage_info[prt_page_itr.start()] = '00000'
+            prtpage_info[prt_page_itr.start()] = [b'00000']
 
     # Retrieve REGTEXT clauses and attach dates and page number tags and attributes to them
     id_seq = 0
-    for reg in re.finditer('(<REGTEXT TITLE.*?</REGTEXT>)', file_string, re.S):
+    for reg in re.finditer(b'(<REGTEXT TITLE.*?</REGTEXT>)', file_string, re.S):
         # Eliminate certain specific REGTEXT buckets
-        if re.search("continues to read", reg.group(0)) and not re.search("revised|revising|amend|remove|add",
-                                                                          reg.group(0)):
+        if re.search(b"continues to read", reg.group(0)) and not re.search(b"revised|revising|amend|remove|add",
+                                                                           reg.group(0)):
             continue
         id_seq += 1
         reg_eff_date = get_from_dict(reg.start(), effdates_info)
 
         # Warn when Pull date is substituted
-        if reg_eff_date[1].find("Pull date:") >= 0:
+        if reg_eff_date[1].find(b"Pull date:") >= 0:
             print("Warning: valid date is not found! Look for 'Pull date:' in the final file!")
 
         if reg_eff_date[0]:
@@ -639,15 +853,14 @@ def partext(temp_file, file_date):
             effdate_attrib = "{0:%Y}0000".format(datetime.strptime(eff_date, "%Y%m%d"))
             effdate_element = reg_eff_date[1]
         reg_prt_num = get_from_dict(reg.start(), prtpage_info)
-        regtxt_attrb = ' EFFDATE=\'' + effdate_attrib + '\' ID=\'' + eff_date + '-' + str(id_seq) + \
-                       '\' FRPAGE=\'' + vol_num + 'FR' + reg_prt_num[
-                           0] + '\'><EFFDATES>' + effdate_element
-        reg_txt = re.sub(">", regtxt_attrb, reg.group(0), count=1)
-        new_file_string += reg_txt
-    new_file_string = "<CFRDOC ED='XX' REV='XX'>\n\n" + new_file_string + "\n</CFRDOC>"
+        regtxt_attrb = (' EFFDATE=\'' + effdate_attrib + '\' ID=\'' + eff_date + '-' + str(id_seq) +
+                        '\' FRPAGE=\'').encode(ENCODING) + vol_num + b'FR' + reg_prt_num[0] + b'\'><EFFDATES>' + \
+                       effdate_element
+        reg_txt = re.sub(b">", regtxt_attrb, reg.group(0), count=1)
+        new_file_string.append(reg_txt)
+    new_file_string = b"<CFRDOC ED='XX' REV='XX'>\n\n" + b"".join(new_file_string) + b"\n</CFRDOC>"
     new_file_name = os.path.join(os.path.dirname(temp_file), eff_date + ".AMD")
-    with open(new_file_name, "w") as text_file:
-        text_file.write(new_file_string)
+    write_text(new_file_name, new_file_string)
     return new_file_name
 
 
@@ -701,4 +914,18 @@ if __name__ == "__main__":
         except SchemaError as e:
             sys.exit(e)
         temp_file = move_files(args['<from>'], args['<to>'], args['--date'])
-        print("\n*** Files Moved & Combined! Destination file is located here: " + temp_file.name + " ***")
\ No newline at end of file
+        print("\n*** Files Moved & Combined! Destination file is located here: " + temp_file.name + " ***")
+
+    elif args['dev']:
+        schema = Schema({
+            '<file>': And(os.path.isfile, error='\n<file> must exist!!!'),
+            str: object
+        })
+        try:
+            args = schema.validate(args)
+        except SchemaError as e:
+            sys.exit(e)
+        if args['--omega']:
+            dev_rules(args['<file>'], omega_array(), 'omega')
+        else:
+            dev_rules(args['<file>'], alpha_array(), 'alpha')